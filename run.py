@@ -1,5 +1,5 @@
 import argparse
-import glob
+import functools
 import os
 import subprocess
 import sys
@@ -7,13 +7,23 @@ import sys
 import yaml
 from jsonschema import ValidationError
 
+from scripts._schema_core import (
+    DEFAULT_DETECTION_GLOB,
+    VALIDATION_CACHE_PATH,
+    collect_failures,
+    find_detection_files,
+    format_failures,
+    format_validation_error,
+    load_schema,
+    validate_rule_file,
+    validate_rule_text,
+)
 from scripts.ai_validator import (
     DEFAULT_OPENAI_MODEL,
     dump_yaml,
-    format_validation_error,
-    load_schema,
+    read_rule_text,
     request_ai_fix,
-    validate_rule_text,
+    write_rule_text,
 )
 from scripts.threat_intel_workflow import (
     DEFAULT_SCHEMA_CHOICE,
@@ -25,8 +35,15 @@ from scripts.threat_intel_workflow import (
     write_detection_rule,
 )
 
+AUTO_ANSWER_ENV = "DETECTION_AUTO_ANSWER"
+ENV_FILE_KEYS = ("OPENAI_API_KEY", "OPENAI_MODEL", AUTO_ANSWER_ENV)
+
 
 def load_env_file(path=".env"):
+    # .env never overrides the environment, so once every setting it is read
+    # for is already exported there is nothing it could change.
+    if all(key in os.environ for key in ENV_FILE_KEYS):
+        return
     if not os.path.exists(path):
         return
 
@@ -40,7 +57,7 @@ def load_env_file(path=".env"):
             key = key.strip()
             if key.startswith("export "):
                 key = key[len("export ") :].strip()
-            value = value.strip().strip("'").strip('"')
+            value = value.strip().strip("\"'")
             if key and key not in os.environ:
                 os.environ[key] = value
 
@@ -58,40 +75,42 @@ def get_model_name(explicit_model=None):
     )
 
 
-def validate_file(file_path, schema):
+def validate_file(file_path, validator):
     try:
-        with open(file_path, "r", encoding="utf-8") as rule_file:
-            content = rule_file.read()
-        validate_rule_text(content, schema)
+        validate_rule_file(file_path, validator)
         return True, ""
     except (yaml.YAMLError, ValidationError, ValueError, TypeError) as exc:
         return False, format_validation_error(exc)
 
 
-def get_validation_error_for_text(yaml_text, schema):
+def get_validation_error_for_text(yaml_text, validator):
     try:
-        validate_rule_text(yaml_text, schema)
+        validate_rule_text(yaml_text, validator)
         return ""
     except (yaml.YAMLError, ValidationError, ValueError, TypeError) as exc:
         return format_validation_error(exc)
 
 
-def collect_failures(files, schema):
-    failures = {}
-    for file_path in files:
-        is_valid, error = validate_file(file_path, schema)
-        if not is_valid:
-            failures[file_path] = error
-    return failures
+def auto_answer_enabled():
+    return os.getenv(AUTO_ANSWER_ENV, "").strip().lower() in {"1", "true", "yes"}
 
 
-def prompt_choice(prompt, valid_choices):
-    allowed = {choice.lower() for choice in valid_choices}
+@functools.lru_cache(maxsize=16)
+def _norm_choices(choices):
+    allowed = frozenset(choice.lower() for choice in choices)
+    return allowed, ", ".join(sorted(allowed))
+
+
+def prompt_choice(prompt, valid_choices, default=None):
+    allowed, allowed_text = _norm_choices(valid_choices)
+    if default is not None and auto_answer_enabled():
+        print(f"{prompt}{default}")
+        return default
     while True:
         answer = input(prompt).strip().lower()
         if answer in allowed:
             return answer
-        print(f"Please enter one of: {', '.join(sorted(allowed))}")
+        print(f"Please enter one of: {allowed_text}")
 
 
 def prompt_non_empty(prompt):
@@ -164,6 +183,7 @@ def review_generated_rule_loop(
     *,
     initial_candidate,
     schema,
+    validator,
     model,
     source_reference,
     allowed_query_fields,
@@ -179,7 +199,7 @@ def review_generated_rule_loop(
         try:
             normalized_candidate = normalize_and_validate_generated_rule(
                 rule_text=working_text,
-                schema=schema,
+                validator=validator,
                 source_reference=source_reference,
                 allowed_query_fields=set(allowed_query_fields),
             )
@@ -192,6 +212,7 @@ def review_generated_rule_loop(
                 rule_file="generated:threat_intel_rule_review",
                 rule_text=working_text,
                 validation_error=validation_error,
+                schema_json_text=validator.schema_json_text,
             )
             continue
 
@@ -200,7 +221,7 @@ def review_generated_rule_loop(
         print(normalized_candidate)
         print("=" * 60)
 
-        approval = prompt_choice("Is this good? (yes/no): ", {"yes", "no"})
+        approval = prompt_choice("Is this good? (yes/no): ", ("yes", "no"))
         if approval == "yes":
             return normalized_candidate
 
@@ -220,6 +241,7 @@ def review_generated_rule_loop(
                 "User requested revisions to a generated detection rule.\n\n"
                 f"User feedback:\n{user_feedback}"
             ),
+            schema_json_text=validator.schema_json_text,
         )
 
     raise RuntimeError(
@@ -230,7 +252,8 @@ def review_generated_rule_loop(
 def maybe_run_git_follow_up(file_path):
     should_add = prompt_choice(
         "Do you want to git add this detection file? (yes/no): ",
-        {"yes", "no"},
+        ("yes", "no"),
+        default="no",
     )
     if should_add != "yes":
         return
@@ -248,7 +271,8 @@ def maybe_run_git_follow_up(file_path):
 
     should_commit = prompt_choice(
         "Do you want to create a git commit now? (yes/no): ",
-        {"yes", "no"},
+        ("yes", "no"),
+        default="no",
     )
     if should_commit != "yes":
         return
@@ -267,7 +291,8 @@ def maybe_run_git_follow_up(file_path):
 
     should_push = prompt_choice(
         "Do you want to git push now? (yes/no): ",
-        {"yes", "no"},
+        ("yes", "no"),
+        default="no",
     )
     if should_push != "yes":
         return
@@ -288,7 +313,7 @@ def run_threat_intel_intake(model):
     source_name = prompt_non_empty("Enter the threat intel source name: ")
     intake_mode = prompt_choice(
         "How do you want to provide the threat intel? (file/link): ",
-        {"file", "link"},
+        ("file", "link"),
     )
 
     if intake_mode == "link":
@@ -338,7 +363,7 @@ def run_threat_intel_intake(model):
 
     should_generate_rule = prompt_choice(
         "Do you want to create the detection query and rule? (yes/no): ",
-        {"yes", "no"},
+        ("yes", "no"),
     )
     if should_generate_rule != "yes":
         print("Stopping after report review.")
@@ -350,7 +375,7 @@ def run_threat_intel_intake(model):
     print(f"{DEFAULT_SCHEMA_CHOICE}. {DEFAULT_SCHEMA_LABEL}")
     schema_choice = prompt_choice(
         f"Choose a schema ({DEFAULT_SCHEMA_CHOICE}): ",
-        {DEFAULT_SCHEMA_CHOICE},
+        (DEFAULT_SCHEMA_CHOICE,),
     )
 
     try:
@@ -371,6 +396,7 @@ def run_threat_intel_intake(model):
         reviewed_rule_text = review_generated_rule_loop(
             initial_candidate=generation_result["rule_text"],
             schema=generation_result["schema"],
+            validator=generation_result["validator"],
             model=model,
             source_reference=scan_result["source_value"],
             allowed_query_fields=generation_result["allowed_query_fields"],
@@ -409,7 +435,7 @@ def run_threat_intel_intake(model):
 
         confirm_path = prompt_choice(
             "Do you want to use this path? (yes/no): ",
-            {"yes", "no"},
+            ("yes", "no"),
         )
         if confirm_path == "yes":
             output_path = suggested_output_path
@@ -426,26 +452,25 @@ def run_threat_intel_intake(model):
     return 0
 
 
-def normalize_yaml_text(yaml_text):
-    rule_obj = yaml.safe_load(yaml_text)
-    if not isinstance(rule_obj, dict):
-        raise ValueError("Generated YAML is not a mapping.")
-    return dump_yaml(rule_obj)
+def normalize_yaml_text(yaml_text, validator):
+    # The dump of a schema-valid mapping loads back to the same mapping, so
+    # the dumped text is not parsed and validated a second time.
+    return dump_yaml(validate_rule_text(yaml_text, validator))
 
 
-def run_manual_loop(file_path, schema):
+def run_manual_loop(file_path, validator):
     print("okay please fix and type 'run again' to revalidate.")
     while True:
         command = input("> ").strip().lower()
         if command == "run again":
-            is_valid, error = validate_file(file_path, schema)
+            is_valid, error = validate_file(file_path, validator)
             if is_valid:
                 print(f"{file_path} now passes the authorized schema.")
                 return True
             print(f"detection {file_path} still fails authorized schema: {error}")
             next_mode = prompt_choice(
                 "do you want to continue manual fix or let AI do it? (manual/ai): ",
-                {"manual", "ai"},
+                ("manual", "ai"),
             )
             if next_mode == "manual":
                 print("okay please fix and type 'run again' to revalidate.")
@@ -456,21 +481,20 @@ def run_manual_loop(file_path, schema):
         print("Type 'run again' after manual edits, or type 'ai' to switch.")
 
 
-def run_ai_loop(file_path, schema, model, max_attempts):
+def run_ai_loop(file_path, schema, validator, model, max_attempts):
     api_key = get_api_key()
     if not api_key:
         print("OPENAI_API_KEY/OPENAI_API is not set. Cannot run AI fixing.")
         return False
 
-    with open(file_path, "r", encoding="utf-8") as rule_file:
-        original_text = rule_file.read()
+    original_text = read_rule_text(file_path)
 
     working_text = original_text
     user_feedback = ""
     last_valid_candidate = None
 
     for attempt in range(1, max_attempts + 1):
-        validation_error = get_validation_error_for_text(working_text, schema)
+        validation_error = get_validation_error_for_text(working_text, validator)
         if not validation_error:
             validation_error = "User requested revisions to an already schema-valid rule."
         full_error_context = validation_error
@@ -487,14 +511,14 @@ def run_ai_loop(file_path, schema, model, max_attempts):
                 rule_file=file_path,
                 rule_text=working_text,
                 validation_error=full_error_context,
+                schema_json_text=validator.schema_json_text,
             )
         except Exception as exc:  # noqa: BLE001
             print(f"AI request failed on attempt {attempt}: {exc}")
             continue
 
         try:
-            normalized_candidate = normalize_yaml_text(candidate)
-            validate_rule_text(normalized_candidate, schema)
+            normalized_candidate = normalize_yaml_text(candidate, validator)
         except Exception as exc:  # noqa: BLE001
             print(f"AI output failed schema on attempt {attempt}: {exc}")
             working_text = candidate
@@ -510,10 +534,9 @@ def run_ai_loop(file_path, schema, model, max_attempts):
         print("=" * 60)
         print("Please validate this output.")
 
-        approval = prompt_choice("Is this good? (yes/no): ", {"yes", "no"})
+        approval = prompt_choice("Is this good? (yes/no): ", ("yes", "no"))
         if approval == "yes":
-            with open(file_path, "w", encoding="utf-8") as rule_file:
-                rule_file.write(last_valid_candidate)
+            write_rule_text(file_path, last_valid_candidate, original_text)
             print("thank you")
             return True
 
@@ -529,45 +552,43 @@ def run_ai_loop(file_path, schema, model, max_attempts):
         "to the detection folders? if not the original detection remains "
         "(before ai touched it)"
     )
-    final_post = prompt_choice("(yes/no): ", {"yes", "no"})
+    final_post = prompt_choice("(yes/no): ", ("yes", "no"))
     if final_post == "yes":
         if last_valid_candidate is None:
             print("No valid AI candidate exists to post. Original detection remains.")
             return False
-        with open(file_path, "w", encoding="utf-8") as rule_file:
-            rule_file.write(last_valid_candidate)
+        write_rule_text(file_path, last_valid_candidate, original_text)
         print(f"Posted latest AI candidate to {file_path}.")
         return True
 
-    with open(file_path, "w", encoding="utf-8") as rule_file:
-        rule_file.write(original_text)
+    # Nothing was written above, so the original is still on disk.
     print("Original detection remains unchanged.")
     return False
 
 
-def handle_failed_file(file_path, error, schema, model, max_attempts):
+def handle_failed_file(file_path, error, schema, validator, model, max_attempts):
     print(f"\ndetection {file_path} failed the authorized schema.")
     print(f"reason: {error}")
     choice = prompt_choice(
         "do you want to fix manually ? or let AI do it for you? (manual/ai): ",
-        {"manual", "ai"},
+        ("manual", "ai"),
     )
 
     if choice == "manual":
-        manual_success = run_manual_loop(file_path, schema)
+        manual_success = run_manual_loop(file_path, validator)
         if manual_success:
             return True
-        return run_ai_loop(file_path, schema, model, max_attempts)
+        return run_ai_loop(file_path, schema, validator, model, max_attempts)
 
-    return run_ai_loop(file_path, schema, model, max_attempts)
+    return run_ai_loop(file_path, schema, validator, model, max_attempts)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Interactive detection validation CLI.")
     parser.add_argument(
         "--pattern",
-        default="Detections/**/*.yml",
-        help="Detection glob pattern (default: Detections/**/*.yml)",
+        default=DEFAULT_DETECTION_GLOB,
+        help=f"Detection glob pattern (default: {DEFAULT_DETECTION_GLOB})",
     )
     parser.add_argument(
         "--model",
@@ -583,6 +604,14 @@ def main():
         default=3,
         help="Maximum interactive AI edit attempts per file (default: 3)",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=(
+            "Revalidate every file instead of skipping files unchanged since "
+            f"they last passed ({VALIDATION_CACHE_PATH})."
+        ),
+    )
     args = parser.parse_args()
 
     load_env_file(".env")
@@ -595,43 +624,50 @@ def main():
     print("Select a workflow:")
     print("1. Test current detection rules")
     print("2. Create a detection rule from threat intel")
-    workflow = prompt_choice("Enter 1 or 2: ", {"1", "2"})
+    workflow = prompt_choice("Enter 1 or 2: ", ("1", "2"), default="1")
 
     if workflow == "2":
         return run_threat_intel_intake(selected_model)
 
-    files = sorted(glob.glob(args.pattern, recursive=True))
+    files = find_detection_files(args.pattern)
     if not files:
         print(f"No detection files found for pattern: {args.pattern}")
         return 1
 
     try:
-        schema, schema_path = load_schema()
+        schema, schema_path, validator = load_schema()
     except Exception as exc:  # noqa: BLE001
         print(f"Failed to load schema: {exc}")
         return 1
     print(f"Loaded schema: {schema_path}")
     print(f"Using model: {selected_model}")
 
-    failures = collect_failures(files, schema)
+    cache_path = None if args.no_cache else VALIDATION_CACHE_PATH
+    failures = collect_failures(files, validator, cache_path)
     if not failures:
         print("All detections pass schema validation.")
         return 0
 
+    if auto_answer_enabled():
+        # Fixing is interactive, so unattended runs only report.
+        print(f"{AUTO_ANSWER_ENV} is set; skipping manual/AI fixes.")
+        print(format_failures(failures))
+        return 1
+
     for file_path, error in failures.items():
         handle_failed_file(
             file_path=file_path,
             error=error,
             schema=schema,
+            validator=validator,
             model=selected_model,
             max_attempts=max(1, args.max_ai_attempts),
         )
 
-    final_failures = collect_failures(files, schema)
+    final_failures = collect_failures(files, validator, cache_path)
     if final_failures:
         print("\nFinal result: some detections are still invalid.")
-        for file_path, error in final_failures.items():
-            print(f"- {file_path}: {error}")
+        print(format_failures(final_failures))
         return 1
 
     print("\nFinal result: all detections pass schema validation.")
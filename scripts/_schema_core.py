@@ -0,0 +1,308 @@
+import copy
+import functools
+import glob
+import hashlib
+import io
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import fastjsonschema
+import yaml
+from jsonschema import Draft7Validator, ValidationError
+from jsonschema.exceptions import SchemaError, best_match
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib encoder
+    orjson = None
+
+DETECTIONS_ROOT = "Detections"
+DETECTION_EXTENSION = ".yml"
+DEFAULT_DETECTION_GLOB = f"{DETECTIONS_ROOT}/**/*{DETECTION_EXTENSION}"
+SCHEMA_CANDIDATES = (
+    Path("KnowledgeBase/Schemas/DefaultSchema.yaml"),
+    Path("KnowledgeBase/Schemas/DefaultSchema.yml"),
+    Path("KnowledgeBase/Schemas/DefaultSchema.json"),
+)
+# Starting the process pool costs ~90ms on a multi-core Linux host (more with
+# spawn), against ~0.2ms to parse and validate one rule, so the pool only pays
+# off for a few hundred files.
+PARALLEL_MIN_FILES = 512
+PARALLEL_CHUNKSIZE = 16
+READ_AHEAD_MIN_FILES = 64
+READ_AHEAD_DEPTH = 64
+VALIDATION_CACHE_PATH = Path(".detection_validator_cache.json")
+
+
+def dump_schema_json(schema):
+    if orjson is not None:
+        try:
+            return orjson.dumps(schema, option=orjson.OPT_INDENT_2).decode("utf-8")
+        except TypeError:  # e.g. non-string keys, which json.dumps coerces
+            pass
+    return json.dumps(schema, indent=2)
+
+
+class RuleValidator:
+    """Schema validator with a compiled fast path for rules that pass.
+
+    fastjsonschema generates plain Python for the schema, which is much cheaper
+    than jsonschema's tree walk. Rules it rejects are re-checked with the
+    Draft7Validator so error messages and paths stay the same.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.schema_hash = hashlib.blake2b(
+            json.dumps(schema, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        # Serialized once for every AI prompt that embeds the schema.
+        self.schema_json_text = dump_schema_json(schema)
+        self._draft7 = Draft7Validator(schema)
+        try:
+            self._fast_validate = fastjsonschema.compile(
+                schema,
+                use_default=False,
+                use_formats=False,
+                detailed_exceptions=False,
+            )
+        except fastjsonschema.JsonSchemaDefinitionException:
+            self._fast_validate = None
+
+    def validate(self, rule):
+        if self._fast_validate is not None:
+            try:
+                self._fast_validate(rule)
+                return
+            except fastjsonschema.JsonSchemaException:
+                pass
+        error = best_match(self._draft7.iter_errors(rule))
+        if error is not None:
+            raise error
+
+
+@functools.singledispatch
+def format_validation_error(exc):
+    return str(exc)
+
+
+@format_validation_error.register
+def _(exc: ValidationError):
+    location = ".".join(map(str, exc.absolute_path)) or "<root>"
+    return f"{location}: {exc.message}"
+
+
+@format_validation_error.register
+def _(exc: yaml.YAMLError):
+    mark = getattr(exc, "problem_mark", None)
+    if mark is not None:
+        return f"YAML parse error at line {mark.line + 1}, column {mark.column + 1}: {exc}"
+    return f"YAML parse error: {exc}"
+
+
+def load_schema():
+    for schema_path in SCHEMA_CANDIDATES:
+        if not schema_path.exists():
+            continue
+
+        with schema_path.open("rb") as schema_file:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(schema_file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            if schema_path.suffix == ".json":
+                schema = json.load(schema_file)
+            else:
+                schema = yaml.load(schema_file, Loader=SafeLoader)
+
+        if not isinstance(schema, dict):
+            raise ValueError(f"Schema file is empty or not a mapping: {schema_path}")
+        try:
+            Draft7Validator.check_schema(schema)
+        except SchemaError as exc:
+            raise ValueError(
+                f"Schema file is not a valid JSON Schema ({schema_path}): {exc.message}"
+            ) from exc
+        return schema, schema_path, RuleValidator(schema)
+
+    raise FileNotFoundError(
+        "No schema file found. Expected one of: "
+        + ", ".join(str(path) for path in SCHEMA_CANDIDATES)
+    )
+
+
+def iter_detection_files(root=DETECTIONS_ROOT, ext=DETECTION_EXTENSION):
+    """Yield rule file paths under root, matching glob's root/**/*ext."""
+    try:
+        with os.scandir(root) as scanner:
+            entries = list(scanner)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for entry in entries:
+        if entry.name.startswith("."):
+            continue
+        if entry.is_dir():
+            yield from iter_detection_files(entry.path, ext)
+        elif entry.name.endswith(ext) and entry.is_file():
+            yield entry.path
+
+
+def find_detection_files(pattern=DEFAULT_DETECTION_GLOB):
+    # The default layout is walked with scandir, which avoids glob's pattern
+    # matching on every name; custom patterns use glob.
+    if pattern == DEFAULT_DETECTION_GLOB:
+        return sorted(iter_detection_files())
+    return sorted(glob.glob(pattern, recursive=True))
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_yaml(text):
+    return yaml.load(text, Loader=SafeLoader)
+
+
+def _check_rule(rule, validator):
+    if not isinstance(rule, dict):
+        raise ValueError("Rule is empty or not a YAML object")
+    validator.validate(rule)
+
+
+def validate_rule_text(rule_text, validator):
+    rule = _parse_yaml(rule_text)
+    _check_rule(rule, validator)
+    # The parsed object is shared through the cache; callers may modify theirs.
+    return copy.deepcopy(rule)
+
+
+_worker_validator = None
+
+
+def _init_worker(schema):
+    global _worker_validator
+    _worker_validator = RuleValidator(schema)
+
+
+def validate_rule_file(rule_file, validator, content=None):
+    # Bytes go straight to the YAML parser, skipping the text-mode decoder.
+    if content is None:
+        content = Path(rule_file).read_bytes()
+    # A named stream keeps the file path in YAML parse errors.
+    stream = io.BytesIO(content)
+    stream.name = os.fspath(rule_file)
+    # Each file is parsed once per scan, so this skips the parse cache.
+    rule = yaml.load(stream, Loader=SafeLoader)
+    _check_rule(rule, validator)
+
+
+def _validate_one(rule_file, validator=None, content=None):
+    try:
+        validate_rule_file(rule_file, validator or _worker_validator, content)
+    except (yaml.YAMLError, ValidationError, ValueError, TypeError) as exc:
+        return rule_file, format_validation_error(exc)
+    return rule_file, ""
+
+
+def format_failures(failures):
+    # One string so a long failure list is written in a single print call.
+    return "\n".join(f"- {rule_file}: {error}" for rule_file, error in failures.items())
+
+
+def load_validation_cache(cache_path):
+    try:
+        with open(cache_path, "r", encoding="utf-8") as handle:
+            cache = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_validation_cache(cache_path, cache):
+    try:
+        with open(cache_path, "w", encoding="utf-8") as handle:
+            json.dump(cache, handle, sort_keys=True)
+    except OSError as exc:
+        print(f"Could not write validation cache {cache_path}: {exc}")
+
+
+def _read_ahead(files):
+    """Yield (path, future bytes) in order with up to READ_AHEAD_DEPTH reads queued."""
+    remaining = iter(files)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        queued = deque()
+        for rule_file in remaining:
+            queued.append((rule_file, executor.submit(Path(rule_file).read_bytes)))
+            if len(queued) >= READ_AHEAD_DEPTH:
+                break
+        while queued:
+            yield queued.popleft()
+            rule_file = next(remaining, None)
+            if rule_file is not None:
+                queued.append((rule_file, executor.submit(Path(rule_file).read_bytes)))
+
+
+def _validate_files(files, validator):
+    if len(files) >= PARALLEL_MIN_FILES and (os.cpu_count() or 1) > 1:
+        # Each worker compiles its own validator once; only paths and error
+        # strings cross the process boundary.
+        with ProcessPoolExecutor(
+            initializer=_init_worker, initargs=(validator.schema,)
+        ) as executor:
+            return list(
+                executor.map(_validate_one, files, chunksize=PARALLEL_CHUNKSIZE)
+            )
+
+    if len(files) > READ_AHEAD_MIN_FILES:
+        # Below the pool threshold, or on a single core, reader threads can
+        # still keep disk latency off the parse/validate loop.
+        return [
+            _validate_one(rule_file, validator, future.result())
+            for rule_file, future in _read_ahead(files)
+        ]
+    return [_validate_one(rule_file, validator) for rule_file in files]
+
+
+def collect_failures(files, validator, cache_path=None):
+    if cache_path is None:
+        results = _validate_files(files, validator)
+        return {rule_file: error for rule_file, error in results if error}
+
+    # Files that passed last time and have the same mtime, size and schema
+    # are skipped without being read.
+    cache = load_validation_cache(cache_path)
+    file_stats = {}
+    pending = []
+    for rule_file in files:
+        try:
+            stat = os.stat(rule_file)
+        except OSError:
+            pending.append(rule_file)
+            continue
+        fingerprint = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "schema_hash": validator.schema_hash,
+        }
+        file_stats[rule_file] = fingerprint
+        cached = cache.get(rule_file)
+        if (
+            isinstance(cached, dict)
+            and cached.get("status") == "valid"
+            and all(cached.get(key) == value for key, value in fingerprint.items())
+        ):
+            continue
+        pending.append(rule_file)
+
+    results = _validate_files(pending, validator)
+    for rule_file, error in results:
+        if rule_file in file_stats:
+            cache[rule_file] = {
+                **file_stats[rule_file],
+                "status": "invalid" if error else "valid",
+            }
+    save_validation_cache(cache_path, cache)
+    return {rule_file: error for rule_file, error in results if error}
@@ -1,28 +1,36 @@
 import argparse
-import glob
+import atexit
 import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import requests
 import yaml
-from jsonschema import Draft7Validator, ValidationError, validate
-from jsonschema.exceptions import SchemaError
-
-DEFAULT_DETECTION_GLOB = "Detections/**/*.yml"
-SCHEMA_CANDIDATES = (
-    Path("KnowledgeBase/Schemas/DefaultSchema.yaml"),
-    Path("KnowledgeBase/Schemas/DefaultSchema.yml"),
-    Path("KnowledgeBase/Schemas/DefaultSchema.json"),
+from jsonschema import ValidationError
+from requests.adapters import HTTPAdapter
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from scripts._schema_core import (  # noqa: E402
+    DEFAULT_DETECTION_GLOB,
+    collect_failures,
+    dump_schema_json,
+    find_detection_files,
+    format_validation_error,
+    load_schema,
+    validate_rule_text,
 )
+
 OPENAI_RESPONSES_URL = "https://api.openai.com/v1/responses"
+DEFAULT_AI_CONCURRENCY = 4
+AI_BATCH_SIZE = 5
 DEFAULT_OPENAI_MODEL = "gpt-5.2"
 
-SYSTEM_PROMPT = """You are a strict Elastic SIEM detection rule editor.
-Return only corrected YAML with no markdown fences and no commentary.
-
-Hard constraints:
+RULE_CONSTRAINTS = """Hard constraints:
 - Output must be valid YAML mapping.
 - Keep existing detection intent and query logic unless invalid syntax must be repaired.
 - Keep field names exactly as provided by the schema and preserve unknown fields if valid.
@@ -35,7 +43,27 @@ Hard constraints:
 - version must be non-empty number or string.
 - Keep YAML clean and deployment-safe for Elastic detection API payload usage."""
 
+SYSTEM_PROMPT = f"""You are a strict Elastic SIEM detection rule editor.
+Return only corrected YAML with no markdown fences and no commentary.
+
+{RULE_CONSTRAINTS}"""
+
+BATCH_SYSTEM_PROMPT = f"""You are a strict Elastic SIEM detection rule editor.
+You will receive several detection rule files, each with its validation error.
+Return only a JSON array with no markdown fences and no commentary. Include one
+object per input file: {{"path": "<file path>", "fixed_yaml": "<corrected YAML>"}}.
 
+Every fixed_yaml value must follow these rules.
+{RULE_CONSTRAINTS}"""
+
+# One keep-alive session for all OpenAI calls so retries reuse the TLS connection.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+atexit.register(_SESSION.close)
+
+
+# Stays on the pure-Python dumper: libyaml's emitter ignores the
+# increase_indent override below and would change the list layout.
 class PrettyDumper(yaml.SafeDumper):
     def increase_indent(self, flow=False, indentless=False):
         return super().increase_indent(flow, False)
@@ -53,62 +81,23 @@ def dump_yaml(rule_obj):
     )
 
 
-def format_validation_error(exc):
-    if isinstance(exc, ValidationError):
-        location = ".".join(str(part) for part in exc.absolute_path) or "<root>"
-        return f"{location}: {exc.message}"
-    if isinstance(exc, yaml.YAMLError):
-        mark = getattr(exc, "problem_mark", None)
-        if mark is not None:
-            return f"YAML parse error at line {mark.line + 1}, column {mark.column + 1}: {exc}"
-        return f"YAML parse error: {exc}"
-    return str(exc)
-
-
-def load_schema():
-    for schema_path in SCHEMA_CANDIDATES:
-        if not schema_path.exists():
-            continue
-
-        with schema_path.open("r", encoding="utf-8") as schema_file:
-            if schema_path.suffix == ".json":
-                schema = json.load(schema_file)
-            else:
-                schema = yaml.safe_load(schema_file)
-
-        if not isinstance(schema, dict):
-            raise ValueError(f"Schema file is empty or not a mapping: {schema_path}")
-        try:
-            Draft7Validator.check_schema(schema)
-        except SchemaError as exc:
-            raise ValueError(
-                f"Schema file is not a valid JSON Schema ({schema_path}): {exc.message}"
-            ) from exc
-        return schema, schema_path
-
-    raise FileNotFoundError(
-        "No schema file found. Expected one of: "
-        + ", ".join(str(path) for path in SCHEMA_CANDIDATES)
-    )
+def read_rule_text(rule_file):
+    # Text mode, so CRLF files compare equal to the LF text the fixer produces.
+    with open(rule_file, "r", encoding="utf-8") as handle:
+        return handle.read()
 
 
-def validate_rule_text(rule_text, schema):
-    rule = yaml.safe_load(rule_text)
-    if not isinstance(rule, dict):
-        raise ValueError("Rule is empty or not a YAML object")
-    validate(instance=rule, schema=schema)
-    return rule
+def write_rule_text(rule_file, text, original_text):
+    """Write text to rule_file unless it matches what is already on disk.
 
-
-def collect_invalid_files(files, schema):
-    invalid = {}
-    for rule_file in files:
-        try:
-            with open(rule_file, "r", encoding="utf-8") as handle:
-                validate_rule_text(handle.read(), schema)
-        except (yaml.YAMLError, ValidationError, ValueError, TypeError) as exc:
-            invalid[rule_file] = format_validation_error(exc)
-    return invalid
+    Skipping identical writes keeps the file's mtime, so the validation cache
+    entry for it stays valid.
+    """
+    if text == original_text:
+        return False
+    with open(rule_file, "w", encoding="utf-8") as handle:
+        handle.write(text)
+    return True
 
 
 def _strip_code_fences(text):
@@ -139,30 +128,14 @@ def _extract_response_text(response_json):
     return "\n".join(chunks).strip()
 
 
-def request_ai_fix(
-    *,
-    api_key,
-    model,
-    schema,
-    rule_file,
-    rule_text,
-    validation_error,
-    timeout=120,
-):
-    prompt = (
-        f"File path: {rule_file}\n"
-        f"Schema (JSON):\n{json.dumps(schema, indent=2)}\n\n"
-        f"Validation error:\n{validation_error}\n\n"
-        f"Original YAML:\n{rule_text}"
-    )
-
+def _request_response_text(*, api_key, model, instructions, prompt, timeout):
     payload = {
         "model": model,
-        "instructions": SYSTEM_PROMPT,
+        "instructions": instructions,
         "input": prompt,
     }
 
-    response = requests.post(
+    response = _SESSION.post(
         OPENAI_RESPONSES_URL,
         headers={
             "Authorization": f"Bearer {api_key}",
@@ -184,21 +157,85 @@ def request_ai_fix(
 
     response_json = response.json()
 
-    fixed_text = _extract_response_text(response_json)
-    fixed_text = _strip_code_fences(fixed_text)
-    if not fixed_text:
+    text = _strip_code_fences(_extract_response_text(response_json))
+    if not text:
         raise ValueError("OpenAI returned an empty response")
-    return fixed_text
+    return text
 
 
-def fix_file_with_ai(rule_file, schema, api_key, model, max_attempts, write_changes):
-    with open(rule_file, "r", encoding="utf-8") as handle:
-        current_text = handle.read()
+def request_ai_fix(
+    *,
+    api_key,
+    model,
+    schema,
+    rule_file,
+    rule_text,
+    validation_error,
+    schema_json_text=None,
+    timeout=120,
+):
+    if schema_json_text is None:
+        schema_json_text = dump_schema_json(schema)
+    prompt = (
+        f"File path: {rule_file}\n"
+        f"Schema (JSON):\n{schema_json_text}\n\n"
+        f"Validation error:\n{validation_error}\n\n"
+        f"Original YAML:\n{rule_text}"
+    )
+    return _request_response_text(
+        api_key=api_key,
+        model=model,
+        instructions=SYSTEM_PROMPT,
+        prompt=prompt,
+        timeout=timeout,
+    )
+
+
+def request_ai_fix_batch(*, api_key, model, schema_json_text, items, timeout=120):
+    """Ask for fixes to several rules in one request.
+
+    items is a list of {"path", "rule_text", "validation_error"} dicts. Returns a
+    mapping of path to the fixed YAML text the model produced for it.
+    """
+    sections = [f"Schema (JSON):\n{schema_json_text}"]
+    for item in items:
+        sections.append(
+            f"File path: {item['path']}\n"
+            f"Validation error:\n{item['validation_error']}\n\n"
+            f"Original YAML:\n{item['rule_text']}"
+        )
+    response_text = _request_response_text(
+        api_key=api_key,
+        model=model,
+        instructions=BATCH_SYSTEM_PROMPT,
+        prompt="\n\n---\n\n".join(sections),
+        timeout=timeout,
+    )
+
+    results = json.loads(response_text)
+    if not isinstance(results, list):
+        raise ValueError("OpenAI batch response is not a JSON array")
+    fixed_texts = {}
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        path = result.get("path")
+        fixed_yaml = result.get("fixed_yaml")
+        if isinstance(path, str) and isinstance(fixed_yaml, str) and fixed_yaml.strip():
+            fixed_texts[path] = _strip_code_fences(fixed_yaml)
+    return fixed_texts
+
+
+def fix_file_with_ai(
+    rule_file, schema, validator, api_key, model, max_attempts, write_changes
+):
+    original_text = read_rule_text(rule_file)
+    current_text = original_text
 
     last_error = "Unknown validation failure"
     for attempt in range(1, max_attempts + 1):
         try:
-            validate_rule_text(current_text, schema)
+            validate_rule_text(current_text, validator)
             return True, "already valid"
         except (yaml.YAMLError, ValidationError, ValueError, TypeError) as exc:
             last_error = format_validation_error(exc)
@@ -210,10 +247,11 @@ def fix_file_with_ai(rule_file, schema, api_key, model, max_attempts, write_chan
             rule_file=rule_file,
             rule_text=current_text,
             validation_error=last_error,
+            schema_json_text=validator.schema_json_text,
         )
 
         try:
-            fixed_rule = validate_rule_text(fixed_text, schema)
+            fixed_rule = validate_rule_text(fixed_text, validator)
         except (yaml.YAMLError, ValidationError, ValueError, TypeError) as exc:
             last_error = (
                 f"attempt {attempt} produced invalid output: "
@@ -224,28 +262,64 @@ def fix_file_with_ai(rule_file, schema, api_key, model, max_attempts, write_chan
 
         normalized_text = dump_yaml(fixed_rule)
         if write_changes:
-            with open(rule_file, "w", encoding="utf-8") as handle:
-                handle.write(normalized_text)
+            write_rule_text(rule_file, normalized_text, original_text)
         changed = normalized_text != current_text
         return True, "updated" if changed else "normalized"
 
     return False, last_error
 
 
+def fix_files_with_ai_batch(invalid, validator, api_key, model, write_changes):
+    """Fix several files with one AI request; return {path: detail} for fixed ones."""
+    items = [
+        {
+            "path": rule_file,
+            "rule_text": read_rule_text(rule_file),
+            "validation_error": reason,
+        }
+        for rule_file, reason in invalid.items()
+    ]
+    fixed_texts = request_ai_fix_batch(
+        api_key=api_key,
+        model=model,
+        schema_json_text=validator.schema_json_text,
+        items=items,
+    )
+
+    fixed = {}
+    for item in items:
+        fixed_text = fixed_texts.get(item["path"])
+        if fixed_text is None:
+            continue
+        try:
+            fixed_rule = validate_rule_text(fixed_text, validator)
+        except (yaml.YAMLError, ValidationError, ValueError, TypeError):
+            continue
+
+        normalized_text = dump_yaml(fixed_rule)
+        if write_changes:
+            write_rule_text(item["path"], normalized_text, item["rule_text"])
+        changed = normalized_text != item["rule_text"]
+        fixed[item["path"]] = "updated" if changed else "normalized"
+    return fixed
+
+
 def run_ai_fixer(
     files,
     schema,
+    validator,
     *,
     model=DEFAULT_OPENAI_MODEL,
     api_key=None,
     max_attempts=2,
     dry_run=False,
+    concurrency=DEFAULT_AI_CONCURRENCY,
 ):
     token = api_key or os.getenv("OPENAI_API_KEY") or os.getenv("OPENAI_API")
     if not token:
         raise RuntimeError("OPENAI_API_KEY/OPENAI_API is not set")
 
-    invalid = collect_invalid_files(files, schema)
+    invalid = collect_failures(files, validator)
     if not invalid:
         return {"valid": len(files), "fixed": 0, "failed": 0, "failed_files": {}}
 
@@ -253,29 +327,71 @@ def run_ai_fixer(
     failed_count = 0
     failed_files = {}
 
-    for rule_file, reason in invalid.items():
-        try:
-            ok, detail = fix_file_with_ai(
+    mode = "would fix" if dry_run else "fixed"
+
+    # The fixes are bound by OpenAI latency, so several requests are kept in
+    # flight at once. Results are still reported in file order.
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        # First pass: send the failing files in small batches so the prompt
+        # preamble and schema are sent once per batch instead of once per file.
+        # The batch request counts as a file's first attempt.
+        invalid_items = list(invalid.items())
+        batches = []
+        if max_attempts > 1:
+            batches = [
+                dict(invalid_items[start : start + AI_BATCH_SIZE])
+                for start in range(0, len(invalid_items), AI_BATCH_SIZE)
+            ]
+            batches = [batch for batch in batches if len(batch) > 1]
+        batched = {rule_file for batch in batches for rule_file in batch}
+        batch_futures = [
+            executor.submit(
+                fix_files_with_ai_batch, batch, validator, token, model, not dry_run
+            )
+            for batch in batches
+        ]
+        batch_fixed = {}
+        for batch_future in batch_futures:
+            try:
+                batch_fixed.update(batch_future.result())
+            except Exception as exc:  # noqa: BLE001
+                print(f"batch AI request failed, retrying files individually: {exc}")
+
+        # Anything the batch did not fix gets its remaining per-file attempts.
+        futures = {
+            rule_file: executor.submit(
+                fix_file_with_ai,
                 rule_file=rule_file,
                 schema=schema,
+                validator=validator,
                 api_key=token,
                 model=model,
-                max_attempts=max_attempts,
+                max_attempts=max_attempts - 1 if rule_file in batched else max_attempts,
                 write_changes=not dry_run,
             )
-            if ok:
+            for rule_file in invalid
+            if rule_file not in batch_fixed
+        }
+
+        for rule_file, reason in invalid.items():
+            if rule_file in batch_fixed:
                 fixed_count += 1
-                mode = "would fix" if dry_run else "fixed"
-                print(f"{mode}: {rule_file} ({detail})")
-            else:
+                print(f"{mode}: {rule_file} ({batch_fixed[rule_file]})")
+                continue
+            try:
+                ok, detail = futures[rule_file].result()
+                if ok:
+                    fixed_count += 1
+                    print(f"{mode}: {rule_file} ({detail})")
+                else:
+                    failed_count += 1
+                    failed_files[rule_file] = detail
+                    print(f"unable to fix: {rule_file} ({detail})")
+            except Exception as exc:  # noqa: BLE001
                 failed_count += 1
-                failed_files[rule_file] = detail
-                print(f"unable to fix: {rule_file} ({detail})")
-        except Exception as exc:  # noqa: BLE001
-            failed_count += 1
-            failed_files[rule_file] = str(exc)
-            print(f"unable to fix: {rule_file} ({exc})")
-            print(f"original validation error: {reason}")
+                failed_files[rule_file] = str(exc)
+                print(f"unable to fix: {rule_file} ({exc})")
+                print(f"original validation error: {reason}")
 
     return {
         "valid": len(files) - len(invalid),
@@ -318,10 +434,19 @@ def main():
         action="store_true",
         help="Show what would be fixed without writing files.",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_AI_CONCURRENCY,
+        help=(
+            "Maximum number of files sent to OpenAI at the same time "
+            f"(default: {DEFAULT_AI_CONCURRENCY})"
+        ),
+    )
     args = parser.parse_args()
 
     try:
-        schema, schema_path = load_schema()
+        schema, schema_path, validator = load_schema()
     except Exception as exc:  # noqa: BLE001
         print(f"Failed to load schema: {exc}")
         return 1
@@ -329,7 +454,7 @@ def main():
     if args.files:
         files = sorted(set(args.files))
     else:
-        files = sorted(glob.glob(args.pattern, recursive=True))
+        files = find_detection_files(args.pattern)
 
     if not files:
         print("No files found.")
@@ -347,9 +472,11 @@ def main():
         result = run_ai_fixer(
             files,
             schema,
+            validator,
             model=selected_model,
             max_attempts=max(1, args.max_attempts),
             dry_run=args.dry_run,
+            concurrency=args.concurrency,
         )
     except Exception as exc:  # noqa: BLE001
         print(f"AI fixer failed: {exc}")
@@ -14,14 +14,18 @@ ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
 
+from scripts._schema_core import (  # noqa: E402
+    SafeLoader,
+    dump_schema_json,
+    format_validation_error,
+    load_schema,
+    validate_rule_text,
+)
 from scripts.ai_validator import (  # noqa: E402
     DEFAULT_OPENAI_MODEL,
     OPENAI_RESPONSES_URL,
     dump_yaml,
-    format_validation_error,
-    load_schema,
     request_ai_fix,
-    validate_rule_text,
 )
 from scripts.file_requests import analyze_threat_intel_file, get_api_key  # noqa: E402
 from scripts.web_requests import analyze_threat_intel_link  # noqa: E402
@@ -125,7 +129,7 @@ def load_workflow_policy():
         return {"minimum_confidence": DEFAULT_MINIMUM_CONFIDENCE}
 
     with open(WORKFLOW_POLICY_PATH, "r", encoding="utf-8") as handle:
-        policy = yaml.safe_load(handle) or {}
+        policy = yaml.load(handle, Loader=SafeLoader) or {}
     if not isinstance(policy, dict):
         raise ValueError(f"Workflow policy must be a mapping: {WORKFLOW_POLICY_PATH}")
     minimum_confidence = str(
@@ -191,7 +195,7 @@ def collect_detection_catalog(pattern=DEFAULT_DETECTION_GLOB, query_char_limit=4
     for file_path in sorted(glob.glob(pattern, recursive=True)):
         try:
             with open(file_path, "r", encoding="utf-8") as handle:
-                detection = yaml.safe_load(handle)
+                detection = yaml.load(handle, Loader=SafeLoader)
         except Exception:  # noqa: BLE001
             continue
 
@@ -459,10 +463,11 @@ def create_review_report(*, source_name, intake_mode, source_value, model=None):
 def get_schema_choice(choice):
     if choice != DEFAULT_SCHEMA_CHOICE:
         raise ValueError(f"Unsupported schema choice: {choice}")
-    schema, schema_path = load_schema()
+    schema, schema_path, validator = load_schema()
     return {
         "schema": schema,
         "schema_path": schema_path,
+        "validator": validator,
         "label": DEFAULT_SCHEMA_LABEL,
     }
 
@@ -496,13 +501,13 @@ def _apply_source_reference(rule_obj, source_reference):
 
 
 def normalize_and_validate_generated_rule(
-    *, rule_text, schema, source_reference, allowed_query_fields
+    *, rule_text, validator, source_reference, allowed_query_fields
 ):
     cleaned_text = _strip_code_fences(rule_text)
-    rule_obj = validate_rule_text(cleaned_text, schema)
+    rule_obj = validate_rule_text(cleaned_text, validator)
     rule_obj = _apply_source_reference(rule_obj, source_reference)
     normalized_text = dump_yaml(rule_obj)
-    validated_rule = validate_rule_text(normalized_text, schema)
+    validated_rule = validate_rule_text(normalized_text, validator)
     query = str(validated_rule.get("query", "")).strip()
     if allowed_query_fields:
         disallowed_fields = [
@@ -563,8 +568,11 @@ def _request_rule_candidate(
     language,
     schema_label,
     schema,
+    schema_json_text=None,
     timeout=120,
 ):
+    if schema_json_text is None:
+        schema_json_text = dump_schema_json(schema)
     input_text = "\n\n".join(
         [
             f"Threat intel source: {source_name}",
@@ -572,7 +580,7 @@ def _request_rule_candidate(
             f"Detection language: {language}",
             f"Schema label: {schema_label}",
             "Schema JSON:",
-            json.dumps(schema, indent=2),
+            schema_json_text,
             "Threat intel report markdown:",
             report_markdown,
         ]
@@ -615,6 +623,7 @@ def generate_detection_rule_from_report(
     ensure_confidence_threshold(scan_result)
     schema_info = get_schema_choice(schema_choice)
     schema = schema_info["schema"]
+    validator = schema_info["validator"]
     schema_path = schema_info["schema_path"]
     prompt_text = load_prompt_text(RULE_GENERATION_PROMPT_PATH)
     knowledge_base = _load_knowledge_base_context()
@@ -649,12 +658,13 @@ def generate_detection_rule_from_report(
         language=language,
         schema_label=schema_info["label"],
         schema=schema,
+        schema_json_text=validator.schema_json_text,
     )
 
     try:
         candidate = normalize_and_validate_generated_rule(
             rule_text=candidate,
-            schema=schema,
+            validator=validator,
             source_reference=scan_result["source_value"],
             allowed_query_fields=allowed_query_fields,
         )
@@ -669,11 +679,12 @@ def generate_detection_rule_from_report(
                 rule_file=f"generated:{source_name}:{language}",
                 rule_text=working_text,
                 validation_error=last_error,
+                schema_json_text=validator.schema_json_text,
             )
             try:
                 candidate = normalize_and_validate_generated_rule(
                     rule_text=working_text,
-                    schema=schema,
+                    validator=validator,
                     source_reference=scan_result["source_value"],
                     allowed_query_fields=allowed_query_fields,
                 )
@@ -690,6 +701,7 @@ def generate_detection_rule_from_report(
         "schema_path": schema_path,
         "model": model_name,
         "schema": schema,
+        "validator": validator,
         "allowed_query_fields": sorted(allowed_query_fields),
     }
 